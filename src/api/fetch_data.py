@@ -1,10 +1,27 @@
 # src/api/fetch_data.py
 
 import os
+import sys
+import json
 import time
+import sqlite3
+import asyncio
+import hashlib
+import weakref
+from collections import deque
+from contextlib import closing
+import aiohttp
 import pandas as pd
-from serpapi import GoogleSearch
+import pyarrow as pa
+import pyarrow.parquet as pq
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential,
+)
 
 load_dotenv()
 
@@ -13,22 +30,236 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Make src/ importable so the raw DB layer can be written in-process
+sys.path.insert(0, os.path.join(BASE_DIR, "src"))
+from db.save_raw_data import save_raw_tables, write_raw_parquet  # noqa: E402
+
+# SerpApi JSON endpoint (same backend GoogleSearch(params).get_dict() calls)
+SERPAPI_URL = "https://serpapi.com/search.json"
+
+# Local response cache: identical SerpApi queries are served from disk
+CACHE_DB_PATH = os.path.join(DATA_DIR, "cache.db")
+CACHE_TTL = 30 * 86400  # seconds; refresh cached results roughly monthly
+
+# Restaurant columns carried onto each review row
+PLACE_FIELDS = ["data_id", "title", "rating", "reviews", "price", "type"]
+
+# Column layout of raw_reviews.parquet (one row per review). review_user
+# stays a nested struct, so nothing downstream has to re-parse it.
+REVIEW_SCHEMA = pa.schema([
+    ("place_data_id", pa.string()),
+    ("place_title", pa.string()),
+    ("place_rating", pa.float64()),
+    ("place_reviews_count", pa.int64()),
+    ("place_price", pa.string()),
+    ("place_type", pa.string()),
+    ("review_user", pa.struct([
+        ("name", pa.string()),
+        ("link", pa.string()),
+        ("contributor_id", pa.string()),
+        ("thumbnail", pa.string()),
+    ])),
+    ("review_rating", pa.float64()),
+    ("review_text", pa.string()),
+    ("review_date", pa.string()),
+    ("review_likes", pa.int64()),
+])
+
+# Parquet codec for the raw intermediates
+PARQUET_COMPRESSION = "zstd"
+
+# Proactive pacing: at most 5 SerpApi requests per second (tune to your plan)
+SERPAPI_MAX_RATE = 5
+SERPAPI_TIME_PERIOD = 1
+
+# At most this many places have review requests in flight (or results
+# waiting to be written) at once; bounds memory while fetching reviews
+REVIEW_WINDOW = 16
+
+# One AsyncLimiter per event loop (each asyncio.run() call gets a fresh loop)
+_LIMITERS = weakref.WeakKeyDictionary()
+
 
 ##############################################################################
-# 1) Fetch business-level restaurant data (local_results) for ONE center
+# 0) Async HTTP helpers (shared by every SerpApi call below)
 ##############################################################################
-def fetch_places(query="restaurants",
-                 ll="@41.8781,-87.6298,14z",
-                 max_pages=3,
-                 page_sleep=1.2):
-    """
-    Fetch restaurant-level results from Google Maps via SerpApi
-    for a single center (ll). Supports pagination via 'start'.
-    Returns a DataFrame of unique restaurants.
-    """
+def _get_api_key():
     api_key = os.getenv("SERPAPI_KEY")
     if not api_key:
         raise RuntimeError("Missing SERPAPI_KEY in .env")
+    return api_key
+
+
+def _client_session():
+    """
+    Open one aiohttp session for a whole batch of requests so connections
+    are pooled and many SerpApi calls can be in flight at the same time.
+    """
+    connector = aiohttp.TCPConnector(limit_per_host=64)
+    return aiohttp.ClientSession(connector=connector)
+
+
+def _get_limiter():
+    """Return the rate limiter bound to the currently running event loop."""
+    loop = asyncio.get_running_loop()
+    limiter = _LIMITERS.get(loop)
+    if limiter is None:
+        limiter = AsyncLimiter(SERPAPI_MAX_RATE, SERPAPI_TIME_PERIOD)
+        _LIMITERS[loop] = limiter
+    return limiter
+
+
+def _run_sync(coro, name):
+    """
+    Run coro to completion from synchronous code. asyncio.run() cannot be
+    nested, so inside a running loop (e.g. a Jupyter notebook) the caller
+    is pointed at the awaitable variant instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    coro.close()
+    raise RuntimeError(
+        f"{name}() cannot be called from a running event loop (e.g. Jupyter); "
+        f"use `await {name}_async(...)` instead"
+    )
+
+
+def _is_retryable_status(status):
+    return status == 429 or status >= 500
+
+
+def _is_retryable(exc):
+    """Retry only on rate limiting (429) and server-side (5xx) errors."""
+    return isinstance(exc, aiohttp.ClientResponseError) and _is_retryable_status(exc.status)
+
+
+def _redact_url(url):
+    """Drop api_key from a request URL so it never shows up in errors or logs."""
+    return url.with_query([(k, v) for k, v in url.query.items() if k != "api_key"])
+
+
+def _response_error(resp):
+    """ClientResponseError for resp whose request URLs carry no api_key."""
+    info = resp.request_info
+    info = info._replace(url=_redact_url(info.url), real_url=_redact_url(info.real_url))
+    return aiohttp.ClientResponseError(
+        info,
+        resp.history,
+        status=resp.status,
+        message=resp.reason,
+        headers=resp.headers,
+    )
+
+
+@retry(
+    retry=retry_if_exception(_is_retryable),
+    wait=wait_exponential(multiplier=1, min=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+async def _serpapi_get(session, params):
+    """
+    GET SerpApi with the given params and return the parsed JSON dict.
+    Every call waits on the rate limiter first, so gathered requests never
+    burst past the per-second cap; 429/5xx responses back off exponentially.
+    Other errors come back as SerpApi's {"error": ...} body, the same dict
+    GoogleSearch(params).get_dict() returned, so callers can skip that query.
+    """
+    async with _get_limiter():
+        async with session.get(SERPAPI_URL, params=params) as resp:
+            if resp.status < 400:
+                return await resp.json()
+            if not _is_retryable_status(resp.status):
+                try:
+                    results = await resp.json()
+                except (aiohttp.ContentTypeError, ValueError):
+                    results = None
+                if isinstance(results, dict) and "error" in results:
+                    return results
+            raise _response_error(resp)
+
+
+##############################################################################
+# 0b) SQLite-backed response cache keyed by the query params
+##############################################################################
+def _cache_key(params):
+    """Stable key for a query: sha1 of the params without the api_key."""
+    key_params = {k: v for k, v in params.items() if k != "api_key"}
+    return hashlib.sha1(json.dumps(key_params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _cache_connect():
+    conn = sqlite3.connect(CACHE_DB_PATH)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses "
+        "(key TEXT PRIMARY KEY, ts REAL, body BLOB)"
+    )
+    return conn
+
+
+def _cache_read(key, ttl):
+    """Return the cached JSON dict for key if it is younger than ttl, else None."""
+    with closing(_cache_connect()) as conn:
+        row = conn.execute(
+            "SELECT ts, body FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+    if row is None or time.time() - row[0] > ttl:
+        return None
+    return json.loads(row[1])
+
+
+def _cache_write(key, results):
+    with closing(_cache_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, ts, body) VALUES (?, ?, ?)",
+            (key, time.time(), json.dumps(results).encode("utf-8")),
+        )
+
+
+async def cached_get(session, params, ttl=CACHE_TTL):
+    """
+    Return SerpApi results for params, hitting the network only when there
+    is no fresh cached copy. Error payloads are never cached.
+    """
+    key = _cache_key(params)
+    results = _cache_read(key, ttl)
+    if results is not None:
+        return results
+
+    results = await _serpapi_get(session, params)
+    if "error" not in results:
+        _cache_write(key, results)
+    return results
+
+
+##############################################################################
+# 0c) De-duplicate restaurants on data_id
+##############################################################################
+def _dedupe_by_data_id(df_places):
+    """
+    Keep the first row for each data_id using a hash-set first-seen mask
+    (cheaper than drop_duplicates' factorize path on a string column).
+    """
+    seen = set()
+    mask = [not (x in seen or seen.add(x)) for x in df_places["data_id"]]
+    return df_places.loc[mask]
+
+
+##############################################################################
+# 1) Fetch business-level restaurant data (local_results) for ONE center
+##############################################################################
+async def fetch_places_async(session,
+                             query="restaurants",
+                             ll="@41.8781,-87.6298,14z",
+                             max_pages=3):
+    """
+    Async version of fetch_places using an existing aiohttp session.
+    Pages are requested in order (we stop early on a short page to save
+    API credits), but several centers can run concurrently via gather.
+    """
+    api_key = _get_api_key()
 
     all_rows = []
 
@@ -44,7 +275,7 @@ def fetch_places(query="restaurants",
         }
 
         print(f"\n[fetch_places] Fetching page {page + 1} (start={start}) for ll={ll} ...")
-        results = GoogleSearch(params).get_dict()
+        results = await cached_get(session, params)
         rows = results.get("local_results", []) or []
         print(f"[fetch_places] Retrieved {len(rows)} rows")
 
@@ -54,124 +285,222 @@ def fetch_places(query="restaurants",
         if len(rows) < 20:
             break
 
-        time.sleep(page_sleep)
-
     df_places = pd.DataFrame(all_rows)
     if not df_places.empty:
-        df_places = df_places.drop_duplicates(subset=["data_id"])
+        df_places = _dedupe_by_data_id(df_places)
 
     return df_places
 
 
+def fetch_places(query="restaurants",
+                 ll="@41.8781,-87.6298,14z",
+                 max_pages=3):
+    """
+    Fetch restaurant-level results from Google Maps via SerpApi
+    for a single center (ll). Supports pagination via 'start'.
+    Returns a DataFrame of unique restaurants.
+    Inside a running event loop (Jupyter), await fetch_places_async instead.
+    """
+    async def _run():
+        async with _client_session() as session:
+            return await fetch_places_async(session, query, ll, max_pages)
+
+    return _run_sync(_run(), "fetch_places")
+
+
 ##############################################################################
 # 2) Fetch reviewer-level data for each restaurant using its data_id
 ##############################################################################
-def fetch_reviews(df_places,
-                  max_places=20,
-                  max_reviews_per_place=20,
-                  sleep_between=1.0):
+async def _fetch_place_reviews(session, row, position, total, max_reviews_per_place):
     """
-    Fetch reviewer-level data using the 'google_maps_reviews' engine.
-    Each restaurant is identified by its data_id.
-    Produces raw_reviews.csv containing review text, rating, user info, etc.
+    Fetch reviews for ONE restaurant row (a namedtuple over PLACE_FIELDS)
+    and return them as a list of dicts.
     """
-    api_key = os.getenv("SERPAPI_KEY")
-    if not api_key:
-        raise RuntimeError("Missing SERPAPI_KEY in .env")
+    data_id = row.data_id
+    title = row.title
+
+    if pd.isna(data_id) or not data_id:
+        return []
+
+    params = {
+        "engine": "google_maps_reviews",
+        "data_id": data_id,
+        "hl": "en",
+        "api_key": _get_api_key(),
+    }
+
+    # A failed place (bad data_id, retries exhausted) yields no reviews
+    # instead of aborting the whole run
+    try:
+        results = await cached_get(session, params)
+    except aiohttp.ClientResponseError as exc:
+        print(f"\n[fetch_reviews] {position}/{total}: {title}")
+        print(f"[fetch_reviews] Skipped: HTTP {exc.status} {exc.message}")
+        return []
+
+    reviews = results.get("reviews", []) or []
+    print(f"\n[fetch_reviews] {position}/{total}: {title}")
+    if "error" in results:
+        print(f"[fetch_reviews] SerpApi error: {results['error']}")
+    print(f"[fetch_reviews] Retrieved {len(reviews)} reviews")
 
     review_rows = []
 
-    # Limit number of restaurants to avoid exhausting API credits
-    subset = df_places.head(max_places)
-
-    for idx, row in subset.iterrows():
-        data_id = row.get("data_id")
-        title = row.get("title")
+    # Limit the number of reviews per restaurant
+    for r in reviews[:max_reviews_per_place]:
+        review_rows.append({
+            # Restaurant (business-level) info
+            "place_data_id": data_id,
+            "place_title": title,
+            "place_rating": row.rating,
+            "place_reviews_count": row.reviews,
+            "place_price": row.price,
+            "place_type": row.type,
+
+            # Reviewer-level info
+            "review_user": r.get("user"),
+            "review_rating": r.get("rating"),
+            "review_text": r.get("snippet") or r.get("text"),
+            "review_date": r.get("date"),
+            "review_likes": r.get("likes"),
+        })
+
+    return review_rows
+
+
+async def fetch_reviews_async(session,
+                              df_places,
+                              max_places=20,
+                              max_reviews_per_place=20):
+    """
+    Async version of fetch_reviews: one request per data_id, at most
+    REVIEW_WINDOW places in flight on the given aiohttp session.
+    Returns the path of raw_reviews.parquet.
+    """
+    _get_api_key()
+
+    # Limit number of restaurants to avoid exhausting API credits;
+    # reindex so every column the review rows read exists (NaN if absent)
+    subset = df_places.head(max_places).reindex(columns=PLACE_FIELDS)
+
+    # Stream rows to disk per place so a mid-run failure keeps everything
+    # fetched so far (each place becomes a Parquet row group; the footer is
+    # still written when an exception unwinds the writer). A sliding window
+    # of tasks keeps place order while capping how many are held at once.
+    out_path = os.path.join(DATA_DIR, "raw_reviews.parquet")
+    n_saved = 0
+    pending = deque()
+
+    def _write(rows):
+        nonlocal n_saved
+        if not rows:
+            return
+        writer.write_table(pa.Table.from_pandas(
+            pd.DataFrame(rows, columns=REVIEW_SCHEMA.names),
+            schema=REVIEW_SCHEMA,
+            preserve_index=False,
+        ))
+        n_saved += len(rows)
+
+    try:
+        with pq.ParquetWriter(out_path, REVIEW_SCHEMA,
+                              compression=PARQUET_COMPRESSION) as writer:
+            for i, row in enumerate(subset.itertuples(index=False)):
+                pending.append(asyncio.ensure_future(
+                    _fetch_place_reviews(session, row, i + 1, len(subset), max_reviews_per_place)
+                ))
+                if len(pending) >= REVIEW_WINDOW:
+                    _write(await pending.popleft())
+
+            while pending:
+                _write(await pending.popleft())
+    finally:
+        for task in pending:
+            task.cancel()
+
+    print(f"\n[fetch_reviews] Saved {n_saved} reviews → {out_path}")
+
+    return out_path
 
-        if not data_id:
-            continue
 
-        print(f"\n[fetch_reviews] {idx + 1}/{len(subset)}: {title}")
+def fetch_reviews(df_places,
+                  max_places=20,
+                  max_reviews_per_place=20):
+    """
+    Fetch reviewer-level data using the 'google_maps_reviews' engine.
+    Each restaurant is identified by its data_id.
+    Produces raw_reviews.parquet containing review text, rating, user info, etc.,
+    and returns its path; use pd.read_parquet(path) when a DataFrame is needed.
+    Inside a running event loop (Jupyter), await fetch_reviews_async instead.
+    """
+    async def _run():
+        async with _client_session() as session:
+            return await fetch_reviews_async(
+                session, df_places, max_places, max_reviews_per_place
+            )
 
-        params = {
-            "engine": "google_maps_reviews",
-            "data_id": data_id,
-            "hl": "en",
-            "api_key": api_key,
-        }
+    return _run_sync(_run(), "fetch_reviews")
 
-        results = GoogleSearch(params).get_dict()
-        reviews = results.get("reviews", []) or []
-        print(f"[fetch_reviews] Retrieved {len(reviews)} reviews")
 
-        # Limit the number of reviews per restaurant
-        for r in reviews[:max_reviews_per_place]:
-            review_rows.append({
-                # Restaurant (business-level) info
-                "place_data_id": data_id,
-                "place_title": title,
-                "place_rating": row.get("rating"),
-                "place_reviews_count": row.get("reviews"),
-                "place_price": row.get("price"),
-                "place_type": row.get("type"),
+##############################################################################
+# 3) Generic: fetch restaurants for ONE center + optional reviews
+##############################################################################
+async def fetch_all_async(query="restaurants",
+                          ll="@41.8781,-87.6298,14z",
+                          max_pages=3,
+                          fetch_review_data=True,
+                          persist_parquet=False):
+    """
+    Async version of fetch_all, for callers already inside an event loop.
+    """
+    # Places and reviews share one session (and its pooled connections)
+    async with _client_session() as session:
+        df_places = await fetch_places_async(session, query, ll, max_pages)
 
-                # Reviewer-level info
-                "review_user": r.get("user"),
-                "review_rating": r.get("rating"),
-                "review_text": r.get("snippet") or r.get("text"),
-                "review_date": r.get("date"),
-                "review_likes": r.get("likes"),
-            })
+        if persist_parquet:
+            out_path = os.path.join(DATA_DIR, "raw_restaurants.parquet")
+            write_raw_parquet(df_places, out_path, compression=PARQUET_COMPRESSION)
+            print(f"\n[fetch_all] Saved {len(df_places)} unique restaurants → {out_path}")
 
-        time.sleep(sleep_between)
+        df_reviews = None
+        if fetch_review_data and not df_places.empty:
+            # The raw layer needs the frame, so load the streamed file here
+            df_reviews = pd.read_parquet(await fetch_reviews_async(session, df_places))
 
-    df_reviews = pd.DataFrame(review_rows)
-    out_path = os.path.join(DATA_DIR, "raw_reviews.csv")
-    df_reviews.to_csv(out_path, index=False)
+    # Only write what this run fetched; never fall back to stale files on disk
+    save_raw_tables(df_places=df_places, df_reviews=df_reviews, read_missing=False)
 
-    print(f"\n[fetch_reviews] Saved {len(df_reviews)} reviews → {out_path}")
-    return df_reviews
+    return df_places, df_reviews
 
 
-##############################################################################
-# 3) Generic: fetch restaurants for ONE center + optional reviews
-##############################################################################
 def fetch_all(query="restaurants",
               ll="@41.8781,-87.6298,14z",
               max_pages=3,
-              fetch_review_data=True):
+              fetch_review_data=True,
+              persist_parquet=False):
     """
     Run the full pipeline for a single center:
     1) Fetch restaurant-level results.
     2) (Optional) Fetch reviewer-level data.
-    Saves restaurants to raw_restaurants.csv and reviews to raw_reviews.csv.
+    3) Write both DataFrames straight into the raw SQLite tables.
+    Set persist_parquet=True to also keep raw_restaurants.parquet on disk.
+    Inside a running event loop (Jupyter), await fetch_all_async instead.
     """
-    df_places = fetch_places(query, ll, max_pages)
-
-    # Save restaurants
-    out_path = os.path.join(DATA_DIR, "raw_restaurants.csv")
-    df_places.to_csv(out_path, index=False)
-    print(f"\n[fetch_all] Saved {len(df_places)} unique restaurants → {out_path}")
-
-    df_reviews = None
-    if fetch_review_data and not df_places.empty:
-        df_reviews = fetch_reviews(df_places)
-
-    return df_places, df_reviews
+    return _run_sync(
+        fetch_all_async(query, ll, max_pages, fetch_review_data, persist_parquet),
+        "fetch_all",
+    )
 
 
 ##############################################################################
 # 4) Evanston-specific helper: use multiple centers & merge
 ##############################################################################
-def fetch_evanston_multi_center(fetch_review_data=True,
-                                max_pages_per_center=2):
+async def fetch_evanston_multi_center_async(fetch_review_data=True,
+                                            max_pages_per_center=2,
+                                            persist_parquet=False):
     """
-    Fetch Evanston restaurant data using multiple centers
-    (North, Downtown, South Evanston), then merge & de-duplicate.
-    Optionally fetch reviewer-level data on top of that.
-
-    Final restaurant output is saved to data/raw_restaurants.csv
-    (Evanston-focused dataset).
+    Async version of fetch_evanston_multi_center, for callers already
+    inside an event loop.
     """
     centers = [
         "@42.0646,-87.6904,14z",  # North Evanston / Central St
@@ -179,33 +508,69 @@ def fetch_evanston_multi_center(fetch_review_data=True,
         "@42.0333,-87.6811,14z",  # South Evanston / Main St
     ]
 
-    dfs = []
-    for ll in centers:
-        print(f"\n[fetch_evanston_multi_center] Fetching for center: {ll}")
-        df_center = fetch_places(
-            query="restaurants",
-            ll=ll,
-            max_pages=max_pages_per_center,
-            page_sleep=1.2,
-        )
-        dfs.append(df_center)
+    # All centers are fetched concurrently, then reviews, all on ONE session
+    # so every SerpApi call reuses the same pooled keep-alive connections
+    async with _client_session() as session:
+        print(f"\n[fetch_evanston_multi_center] Fetching {len(centers)} centers concurrently")
+        tasks = [
+            fetch_places_async(
+                session,
+                query="restaurants",
+                ll=ll,
+                max_pages=max_pages_per_center,
+            )
+            for ll in centers
+        ]
+        dfs = await asyncio.gather(*tasks)
+
+        # Merge centers in one hash pass keyed by data_id (first center wins),
+        # without materializing an intermediate concatenated frame
+        merged = {}
+        for df_center in dfs:
+            if df_center.empty:
+                continue
+            for data_id, record in zip(df_center["data_id"], df_center.to_dict("records")):
+                merged.setdefault(data_id, record)
+
+        df_places = pd.DataFrame(list(merged.values()))
+
+        # Save merged Evanston restaurants
+        if persist_parquet:
+            out_path = os.path.join(DATA_DIR, "raw_restaurants.parquet")
+            write_raw_parquet(df_places, out_path, compression=PARQUET_COMPRESSION)
+            print(f"\n[fetch_evanston_multi_center] Saved {len(df_places)} unique Evanston restaurants → {out_path}")
+
+        df_reviews = None
+        if fetch_review_data and not df_places.empty:
+            # The raw layer needs the frame, so load the streamed file here
+            df_reviews = pd.read_parquet(await fetch_reviews_async(session, df_places))
+
+    # Only write what this run fetched; never fall back to stale files on disk
+    save_raw_tables(df_places=df_places, df_reviews=df_reviews, read_missing=False)
 
-    if dfs:
-        df_places = pd.concat(dfs, ignore_index=True)
-        df_places = df_places.drop_duplicates(subset=["data_id"])
-    else:
-        df_places = pd.DataFrame()
+    return df_places, df_reviews
 
-    # Save merged Evanston restaurants
-    out_path = os.path.join(DATA_DIR, "raw_restaurants.csv")
-    df_places.to_csv(out_path, index=False)
-    print(f"\n[fetch_evanston_multi_center] Saved {len(df_places)} unique Evanston restaurants → {out_path}")
 
-    df_reviews = None
-    if fetch_review_data and not df_places.empty:
-        df_reviews = fetch_reviews(df_places)
+def fetch_evanston_multi_center(fetch_review_data=True,
+                                max_pages_per_center=2,
+                                persist_parquet=False):
+    """
+    Fetch Evanston restaurant data using multiple centers
+    (North, Downtown, South Evanston), then merge & de-duplicate.
+    Optionally fetch reviewer-level data on top of that.
 
-    return df_places, df_reviews
+    Final output is written straight into the raw SQLite tables
+    (Evanston-focused dataset); set persist_parquet=True to also keep
+    data/raw_restaurants.parquet.
+    Inside a running event loop (Jupyter), await
+    fetch_evanston_multi_center_async instead.
+    """
+    return _run_sync(
+        fetch_evanston_multi_center_async(
+            fetch_review_data, max_pages_per_center, persist_parquet
+        ),
+        "fetch_evanston_multi_center",
+    )
 
 
 ##############################################################################
@@ -217,4 +582,4 @@ if __name__ == "__main__":
     fetch_evanston_multi_center(
         fetch_review_data=True,   
         max_pages_per_center=2
-    )
\ No newline at end of file
+    )
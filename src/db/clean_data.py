@@ -4,7 +4,7 @@ import pandas as pd
 import numpy as np
 import sqlite3
 import ast
-from datetime import datetime, timedelta
+import json
 import os
 import re
 
@@ -24,7 +24,12 @@ DATA_DIR = os.path.join(BASE_DIR, "data")
 DB_PATH = os.path.join(DATA_DIR, "restaurants.db")
 
 
-
+# ============================================================
+# Precompiled regexes
+# ============================================================
+_DIGITS = re.compile(r"(\d+)")
+_DOLLARS = re.compile(r"\$+")
+_REL_DATE = re.compile(r"^(a|\d+)\s+\S*?(day|week|month|year)")
 
 
 # ============================================================
@@ -42,141 +47,198 @@ def parse_dict(val):
     return None
 
 
-def extract_reserve_flag(val):
-    """
-    Return True if restaurant supports reservations.
-    SerpApi uses a URL string for 'reserve_a_table' when available.
-    """
-    if isinstance(val, str) and val.startswith("http"):
-        return True
-    return False
+# ============================================================
+# Helper: parse gps_coordinates (e.g., "{'latitude': 42.04, ...}")
+# ============================================================
+def parse_gps(val):
+    """Convert a gps_coordinates value into a dict. Returns {} if parsing fails."""
+    if isinstance(val, dict):
+        return val
+    if isinstance(val, str):
+        try:
+            d = json.loads(val.replace("'", '"'))
+        except ValueError:
+            return {}
+        return d if isinstance(d, dict) else {}
+    return {}
 
-def extract_online_order_flag(val):
+
+# ============================================================
+# Helper: reservation / online-order flags from URL columns
+# ============================================================
+def url_flag_series(values):
     """
-    Return True if restaurant supports online ordering.
-    SerpApi uses a URL string for 'order_online' when available.
+    Return True where the restaurant supports a channel (reservations,
+    online ordering). SerpApi uses a URL string for 'reserve_a_table' /
+    'order_online' when available; one str.startswith pass.
     """
-    if isinstance(val, str) and val.startswith("http"):
-        return True
-    return False
+    return values.astype("string").str.startswith("http").fillna(False).astype(bool)
 
 # ============================================================
 # Helper: extract dine-in, takeout, delivery from service_options
 # ============================================================
-def extract_service_features(service_val):
+def extract_service_features_frame(service_options):
     """
-    Extract dine_in / takeout / delivery features from service_options dict.
-    Delivery is True if ANY key containing “delivery” is True.
+    Extract dine_in / takeout / delivery features from service_options
+    dicts: parse each dict once, flatten with pd.json_normalize, and OR
+    together every column whose key contains “delivery”.
+    Returns a DataFrame with dine_in / takeout / delivery columns.
     """
-    d = parse_dict(service_val)
-    if not isinstance(d, dict):
-        return None, None, None
+    dicts = [d if isinstance(d, dict) else {} for d in service_options.map(parse_dict)]
+    flat = pd.json_normalize(dicts)
+    flat.index = service_options.index
 
-    dine = d.get("dine_in", None)
-    take = d.get("takeout", None)
-    delivery = any("delivery" in k and v for k, v in d.items())
+    features = pd.DataFrame(index=service_options.index)
+    features["dine_in"] = flat.get("dine_in")
+    features["takeout"] = flat.get("takeout")
 
-    return dine, take, delivery
+    delivery_cols = [c for c in flat.columns if "delivery" in c]
+    features["delivery"] = flat[delivery_cols].fillna(False).astype(bool).any(axis=1)
+
+    return features
 
 
 # ============================================================
 # Helper: convert “1 month ago”, “2 weeks ago” → actual datetime
 # ============================================================
-def parse_relative_date(s):
-    """Convert SerpApi relative time strings into actual datetimes."""
-    if not isinstance(s, str):
-        return None
+# Days per unit (month/year are approximations, OK for this analysis)
+RELATIVE_DATE_UNIT_DAYS = {"day": 1, "week": 7, "month": 30, "year": 365}
 
-    s = s.lower().strip()
-    now = datetime.now()
-    parts = s.split()
-
-    if len(parts) < 2:
-        return None
 
-    num_str = parts[0]
-    unit = parts[1]
-
-    if num_str == "a":
-        num = 1
-    else:
-        try:
-            num = int(num_str)
-        except:
-            return None
+def parse_relative_date_series(dates):
+    """
+    Convert SerpApi relative time strings (“a month ago”, “2 weeks ago”)
+    into actual datetimes: one regex extract for (count, unit), one
+    timedelta conversion, and a single `now`. Unparseable → NaT.
+    """
+    s = dates.astype("string").str.lower().str.strip()
+    ext = s.str.extract(_REL_DATE)
 
-    if "day" in unit:
-        return now - timedelta(days=num)
-    if "week" in unit:
-        return now - timedelta(weeks=num)
-    if "month" in unit:
-        return now - timedelta(days=30 * num)   # approx OK
-    if "year" in unit:
-        return now - timedelta(days=365 * num)
+    num = ext[0].replace("a", "1").astype(float)
+    unit_days = ext[1].map(RELATIVE_DATE_UNIT_DAYS).astype(float)
 
-    return None
+    return pd.Timestamp.now() - pd.to_timedelta(num * unit_days, unit="D")
 
 
 # ============================================================
 # Helper: clean cuisine text
 # ============================================================
-def extract_cuisine(t):
-    """Simplify raw cuisine/type text into a standardized cuisine label."""
-    if pd.isna(t):
-        return "Other"
-
-    t = str(t).lower()
-
-    # Explicit cuisine classification
-    if "italian" in t: return "Italian"
-    if "mediterranean" in t: return "Mediterranean"
-    if "mexican" in t: return "Mexican"
-    if "american" in t: return "American"
-    if "japanese" in t or "sushi" in t: return "Japanese"
-    if "chinese" in t: return "Chinese"
-    if "thai" in t: return "Thai"
-    if "indian" in t: return "Indian"
-    if "cafe" in t or "coffee" in t: return "Cafe"
-    if "bbq" in t or "barbecue" in t: return "BBQ"
-    if "pizza" in t: return "Pizza"
-    if "seafood" in t: return "Seafood"
-
-    # If this type is too generic, classify as Other
-    # e.g., "restaurant", "diner", "grill", "eatery"
-    generic_words = ["Restaurant", "restaurant", "diner", "eatery", "grill", "food"]
-    if any(word in t for word in generic_words):
-        return "Other"
+# Explicit cuisine classification, checked in order (first match wins)
+CUISINE_RULES = [
+    (re.compile("italian"), "Italian"),
+    (re.compile("mediterranean"), "Mediterranean"),
+    (re.compile("mexican"), "Mexican"),
+    (re.compile("american"), "American"),
+    (re.compile("japanese|sushi"), "Japanese"),
+    (re.compile("chinese"), "Chinese"),
+    (re.compile("thai"), "Thai"),
+    (re.compile("indian"), "Indian"),
+    (re.compile("cafe|coffee"), "Cafe"),
+    (re.compile("bbq|barbecue"), "BBQ"),
+    (re.compile("pizza"), "Pizza"),
+    (re.compile("seafood"), "Seafood"),
+]
+
+# If this type is too generic, classify as Other
+# e.g., "restaurant", "diner", "grill", "eatery"
+GENERIC_CUISINE_PATTERN = re.compile("restaurant|diner|eatery|grill|food")
+
+
+def _map_unique(values, func):
+    """
+    Run a vectorized func over the distinct non-null values only, then map
+    the results back onto every row (type/price strings repeat heavily).
+    """
+    uniques = pd.Series(values.dropna().unique())
+    lookup = dict(zip(uniques, func(uniques)))
+    return values.map(lookup)
+
+
+def _cuisine_labels(types):
+    """One str.contains mask per rule, combined with np.select."""
+    t = types.astype(str).str.lower()
+
+    conds = [t.str.contains(pattern).to_numpy(dtype=bool) for pattern, _ in CUISINE_RULES]
+    conds.append(t.str.contains(GENERIC_CUISINE_PATTERN).to_numpy(dtype=bool))
+    choices = [label for _, label in CUISINE_RULES] + ["Other"]
 
     # fallback → clean title-case string
-    return t.title()
+    fallback = t.str.title().to_numpy(dtype=object)
+    return np.select(conds, choices, default=fallback)
 
 
-def parse_price_to_level(p):
+def extract_cuisine_series(types):
     """
-    Convert SerpApi price strings into a numeric price level.
-    Examples:
-      "$"      → 1
-      "$$"     → 2
-      "$$$"    → 3
-      "$50–100" → (50+100)/2 = 75
-    If parsing fails, returns None.
+    Simplify raw cuisine/type text into a standardized cuisine label,
+    evaluated once per distinct type. Missing types → "Other".
     """
-    if p is None or (isinstance(p, float) and np.isnan(p)):
-        return None
+    return _map_unique(types, _cuisine_labels).fillna("Other")
+
 
-    s = str(p).strip()
+def _price_levels(prices):
+    """fullmatch for pure '$' strings, extractall + groupby mean for ranges."""
+    s = prices.astype("string").str.strip()
 
     # Pure '$', '$$', '$$$' style
-    if set(s) == {"$"}:
-        return len(s)
+    is_dollars = s.str.fullmatch(_DOLLARS).fillna(False).astype(bool)
+    level = s.str.len().astype(float).where(is_dollars)
 
     # Ranged price like "$10–20" or "$15-30"
-    nums = re.findall(r"\d+", s)
-    if nums:
-        vals = [int(x) for x in nums]
-        return sum(vals) / len(vals)
+    nums = s.str.extractall(_DIGITS)[0].astype(float).groupby(level=0).mean()
+
+    return level.fillna(nums)
+
+
+def parse_price_to_level_series(prices):
+    """
+    Convert SerpApi price strings into a numeric price level,
+    evaluated once per distinct price string. Examples:
+      "$"      → 1
+      "$$"     → 2
+      "$50–100" → (50+100)/2 = 75
+    If parsing fails, returns NaN.
+    """
+    return _map_unique(prices, _price_levels).astype(float)
+
+# ============================================================
+# Helper: bulk-write a DataFrame into SQLite
+# ============================================================
+def _sqlite_type(col):
+    """Map a pandas column dtype to the SQLite type to_sql would use."""
+    if pd.api.types.is_bool_dtype(col) or pd.api.types.is_integer_dtype(col):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(col):
+        return "REAL"
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+def _write_table(conn, df, table):
+    """
+    Replace `table` with the contents of df using one executemany inside a
+    single transaction (instead of DataFrame.to_sql).
+    Missing values are written as NULL; datetimes as ISO-like text.
+    """
+    out = df.copy()
+    for c in out.columns:
+        if pd.api.types.is_datetime64_any_dtype(out[c]):
+            out[c] = out[c].dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+    out = out.astype(object).where(out.notna(), None)
+
+    col_defs = ", ".join(f'"{c}" {_sqlite_type(df[c])}' for c in df.columns)
+    col_names = ", ".join(f'"{c}"' for c in df.columns)
+    placeholders = ", ".join("?" for _ in df.columns)
+
+    with conn:
+        conn.execute("BEGIN")
+        conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+        conn.execute(f'CREATE TABLE "{table}" ({col_defs})')
+        conn.executemany(
+            f'INSERT INTO "{table}" ({col_names}) VALUES ({placeholders})',
+            out.itertuples(index=False, name=None),
+        )
 
-    return None
 
 # ============================================================
 # MAIN CLEANING PROCESS
@@ -198,21 +260,10 @@ def clean_and_save():
     # -----------------------------------------
     places = raw_places.copy()
 
-    # gps_coordinates → lat/lon
-    def safe_lat(x):
-        try:
-            return eval(x).get("latitude")
-        except:
-            return None
-
-    def safe_lon(x):
-        try:
-            return eval(x).get("longitude")
-        except:
-            return None
-
-    places["latitude"] = places["gps_coordinates"].apply(safe_lat)
-    places["longitude"] = places["gps_coordinates"].apply(safe_lon)
+    # gps_coordinates → lat/lon (parse each string once, reuse for both columns)
+    coords = places["gps_coordinates"].map(parse_gps)
+    places["latitude"] = [c.get("latitude") for c in coords]
+    places["longitude"] = [c.get("longitude") for c in coords]
     places = places.dropna(subset=["latitude", "longitude"])
 
     # numeric
@@ -222,7 +273,7 @@ def clean_and_save():
     ).fillna(0)
 
     if "price" in places.columns:
-        places["price_level"] = places["price"].apply(parse_price_to_level)
+        places["price_level"] = parse_price_to_level_series(places["price"])
     elif "price_level" in places.columns:
         # already numeric; just ensure it's numeric
         places["price_level"] = pd.to_numeric(places["price_level"], errors="coerce")
@@ -230,28 +281,34 @@ def clean_and_save():
         places["price_level"] = None
 
     # cuisine
-    places["cuisine"] = places["type"].apply(extract_cuisine)
+    places["cuisine"] = extract_cuisine_series(places["type"])
 
     # service options
-    places["dine_in"], places["takeout"], places["delivery"]= zip(
-        *places["service_options"].apply(extract_service_features)
-    )
+    service = extract_service_features_frame(places["service_options"])
+    places["dine_in"] = service["dine_in"]
+    places["takeout"] = service["takeout"]
+    places["delivery"] = service["delivery"]
     # ====== Reservation flag ======
-    places["has_reserve_table"] = places["reserve_a_table"].apply(extract_reserve_flag)
+    places["has_reserve_table"] = url_flag_series(places["reserve_a_table"])
 
         # NEW: Online order flag 
     if "order_online" in places.columns:
-        places["has_online_order"] = places["order_online"].apply(extract_online_order_flag)
+        places["has_online_order"] = url_flag_series(places["order_online"])
     else:
         places["has_online_order"] = False
 
     # NEW: convert bool-like columns to 0/1 integers
     bool_cols = ["dine_in", "takeout", "delivery", "has_reserve_table", "has_online_order"]
     for c in bool_cols:
-        places[c] = places[c].fillna(False).astype(int)
+        places[c] = places[c].fillna(False).astype("int8")
 
     # NEW: simple convenience score = how many channels are available
-    places["convenience_score"] = places[bool_cols].sum(axis=1)
+    places["convenience_score"] = places[bool_cols].sum(axis=1).astype("int8")
+
+    # Compact dtypes for the clean frame (lossless: rating / price_level stay
+    # float64 so SQLite REAL keeps e.g. 4.7 rather than a widened float32)
+    places["place_reviews_count"] = places["place_reviews_count"].astype("int32")
+    places["cuisine"] = places["cuisine"].astype("category")
 
     clean_places = places[[
         "place_id", "title", "rating", "place_reviews_count",
@@ -282,7 +339,7 @@ def clean_and_save():
 
     # Convert relative date → actual datetime
     if "review_date" in reviews.columns:
-        reviews["review_datetime"] = reviews["review_date"].apply(parse_relative_date)
+        reviews["review_datetime"] = parse_relative_date_series(reviews["review_date"])
     else:
         # Fallback: no date information available
         reviews["review_datetime"] = None
@@ -308,8 +365,22 @@ def clean_and_save():
     # -----------------------------------------
     # SAVE CLEANED TABLES
     # -----------------------------------------
-    clean_places.to_sql("clean_restaurants", conn, if_exists="replace", index=False)
-    clean_reviews.to_sql("clean_reviews", conn, if_exists="replace", index=False)
+    # Bulk writes: WAL journal (persists in the DB file), no per-statement
+    # fsyncs, and a 64 MiB page cache
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-65536")
+
+    _write_table(conn, clean_places, "clean_restaurants")
+    _write_table(conn, clean_reviews, "clean_reviews")
+
+    # Index the join key (tables are recreated above, so indexes are too);
+    # clean_reviews may lack place_id when raw_reviews had no place_data_id
+    with conn:
+        if "place_id" in clean_places.columns:
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_clean_rest_place ON clean_restaurants(place_id)")
+        if "place_id" in clean_reviews.columns:
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_clean_reviews_place ON clean_reviews(place_id)")
 
     conn.close()
     print("✔ Cleaned tables saved → clean_restaurants, clean_reviews")
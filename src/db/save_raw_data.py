@@ -5,27 +5,103 @@
 import os
 import sqlite3
 import ast
+import json
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 
 # Resolve paths: project root / data / db
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 DB_PATH = os.path.join(DATA_DIR, "restaurants.db")
 
+# Columns read as text, never through numeric inference
+# (Google CIDs regularly exceed the int64 maximum and would become floats)
+RAW_TEXT_COLUMNS = ["data_cid"]
 
-def _coerce_object_columns_to_str(df: pd.DataFrame) -> pd.DataFrame:
+# Parquet schema-metadata key listing the columns stored as JSON text
+RAW_JSON_COLUMNS_KEY = b"raw_json_columns"
+
+# For the raw layer: any list/dict-like cells still held as Python objects
+# are stored as TEXT via their repr (same text the CSV round trip produced)
+sqlite3.register_adapter(list, repr)
+sqlite3.register_adapter(dict, repr)
+
+
+def write_raw_parquet(df: pd.DataFrame, path: str, compression: str = "zstd") -> None:
     """
-    For the raw layer: ensure any non-numeric columns are stored as TEXT in SQLite
-    by converting them to string. This safely handles list/dict-like values
-    that might still appear as Python objects.
+    Write a raw DataFrame to Parquet. Columns holding dicts/lists are stored
+    as JSON text (named in the file metadata) so they read back as exactly
+    the same Python objects; as Arrow structs they would gain None keys
+    from other rows and come back with numpy arrays for nested lists.
     """
-    for col in df.columns:
-        if pd.api.types.is_integer_dtype(df[col]) or pd.api.types.is_float_dtype(df[col]):
-            continue
-        df[col] = df[col].astype(str)
+    out = df.copy()
+    json_cols = [
+        c for c in out.columns
+        if out[c].dtype == object
+        and out[c].map(lambda v: isinstance(v, (dict, list))).any()
+    ]
+    for c in json_cols:
+        out[c] = out[c].map(
+            lambda v: json.dumps(v) if isinstance(v, (dict, list)) or not pd.isna(v) else None
+        )
+
+    table = pa.Table.from_pandas(out, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[RAW_JSON_COLUMNS_KEY] = json.dumps(json_cols).encode("utf-8")
+    pq.write_table(table.replace_schema_metadata(metadata), path, compression=compression)
+
+
+def _read_raw_parquet(path: str) -> pd.DataFrame:
+    """Read a Parquet file from write_raw_parquet, decoding its JSON columns."""
+    table = pq.read_table(path)
+    metadata = table.schema.metadata or {}
+    json_cols = json.loads(metadata.get(RAW_JSON_COLUMNS_KEY, b"[]"))
+
+    df = table.to_pandas()
+    for c in json_cols:
+        df[c] = df[c].map(lambda v: json.loads(v) if isinstance(v, str) else None)
     return df
 
 
+def _read_raw_file(name: str):
+    """
+    Load data/<name>.parquet if present (nested columns keep their dict
+    types, so no literal_eval is needed), else data/<name>.csv.
+    Returns None if neither file exists.
+    """
+    parquet_path = os.path.join(DATA_DIR, f"{name}.parquet")
+    if os.path.exists(parquet_path):
+        return _read_raw_parquet(parquet_path)
+
+    csv_path = os.path.join(DATA_DIR, f"{name}.csv")
+    if os.path.exists(csv_path):
+        return _read_raw_csv(csv_path)
+
+    return None
+
+
+def _read_raw_csv(path: str) -> pd.DataFrame:
+    """
+    Read a raw CSV with the multithreaded Arrow parser (Arrow-backed dtypes).
+    RAW_TEXT_COLUMNS are pinned to string.
+    """
+    # pyarrow.csv directly: pandas' engine="pyarrow" infers first and
+    # only casts afterwards, which has already lost the CID digits
+    convert_options = pa_csv.ConvertOptions(
+        column_types={c: pa.string() for c in RAW_TEXT_COLUMNS},
+        strings_can_be_null=True,
+    )
+    # Review text often spans several lines inside quoted cells; without
+    # newlines_in_values the block chunker splits those rows apart
+    parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+    table = pa_csv.read_csv(
+        path, parse_options=parse_options, convert_options=convert_options
+    )
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
 # ------------------------- Places (restaurants) ------------------------- #
 
 def _parse_gps_coordinates(val):
@@ -47,17 +123,21 @@ def _parse_gps_coordinates(val):
     return None, None
 
 
-def prepare_raw_restaurants():
+def prepare_raw_restaurants(df=None):
     """
-    Read raw_restaurants.csv, add latitude/longitude columns,
-    and return a DataFrame ready to be written into SQLite.
+    Add latitude/longitude columns to the restaurants DataFrame and return
+    it ready to be written into SQLite. If df is None, read
+    raw_restaurants.parquet (or .csv).
+    A DataFrame handed over straight from fetch_data still holds
+    gps_coordinates as dicts, so no string re-parse is needed.
     """
-    restaurants_csv = os.path.join(DATA_DIR, "raw_restaurants.csv")
-    if not os.path.exists(restaurants_csv):
-        print("raw_restaurants.csv not found, skipping raw_restaurants table.")
-        return None
-
-    df = pd.read_csv(restaurants_csv)
+    if df is None:
+        df = _read_raw_file("raw_restaurants")
+        if df is None:
+            print("raw_restaurants.parquet/.csv not found, skipping raw_restaurants table.")
+            return None
+    else:
+        df = df.copy()
 
     # Extract GPS lat/lon from gps_coordinates column (if present)
     if "gps_coordinates" in df.columns:
@@ -74,74 +154,93 @@ def prepare_raw_restaurants():
     if "data_cid" in df.columns:
         df["data_cid"] = df["data_cid"].astype(str)
 
-    # Light normalization for raw layer: keep everything but coerce to string where needed
-    df = _coerce_object_columns_to_str(df)
-
     return df
 
 
 # ------------------------- Reviews ------------------------- #
 
-def prepare_raw_reviews():
+def _parse_review_user(val):
     """
-    Read raw_reviews.csv, flatten review_user dict into two columns
-    (review_user_name, review_user_link), then return DataFrame
-    ready to be written into SQLite.
+    raw_reviews.review_user looks like:
+      "{'name': 'Jane D', 'link': 'https://...'}"
+    or a dict. Try the fast json.loads path first and fall back to
+    ast.literal_eval for reprs json can't read (apostrophes, True/None).
     """
-    reviews_csv = os.path.join(DATA_DIR, "raw_reviews.csv")
-    if not os.path.exists(reviews_csv):
-        print("raw_reviews.csv not found, skipping raw_reviews table.")
-        return None
+    if isinstance(val, dict):
+        return val
 
-    df = pd.read_csv(reviews_csv)
+    if isinstance(val, str):
+        try:
+            obj = json.loads(val.replace("'", '"'))
+        except ValueError:
+            try:
+                obj = ast.literal_eval(val)
+            except Exception:
+                return {}
+        return obj if isinstance(obj, dict) else {}
+    return {}
 
-    # If review_user is stored as a dict-like string, parse it
-    if "review_user" in df.columns:
-        def ensure_dict(x):
-            if isinstance(x, dict):
-                return x
-            if isinstance(x, str):
-                try:
-                    return ast.literal_eval(x)
-                except Exception:
-                    return None
+
+def prepare_raw_reviews(df=None):
+    """
+    Flatten review_user dict into two columns
+    (review_user_name, review_user_link), then return DataFrame
+    ready to be written into SQLite. If df is None, read
+    raw_reviews.parquet (or .csv).
+    """
+    if df is None:
+        df = _read_raw_file("raw_reviews")
+        if df is None:
+            print("raw_reviews.parquet/.csv not found, skipping raw_reviews table.")
             return None
+    else:
+        df = df.copy()
 
-        users = df["review_user"].apply(ensure_dict)
+    # review_user is a dict (Parquet / in-memory) or a dict-like string (CSV):
+    # parse each cell once, then flatten all of them in one json_normalize
+    if "review_user" in df.columns:
+        users = pd.json_normalize([_parse_review_user(u) for u in df["review_user"]])
+        users.index = df.index
 
-        df["review_user_name"] = users.apply(
-            lambda u: u.get("name") if isinstance(u, dict) else None
-        )
-        df["review_user_link"] = users.apply(
-            lambda u: u.get("link") if isinstance(u, dict) else None
-        )
+        df["review_user_name"] = users.get("name")
+        df["review_user_link"] = users.get("link")
 
         # We can drop the original dict column in the raw layer DB
         df = df.drop(columns=["review_user"])
 
-    # Light normalization for raw layer
-    df = _coerce_object_columns_to_str(df)
-
     return df
 
 
 # ------------------------- Main save function ------------------------- #
 
-def save_raw_tables():
+def save_raw_tables(df_places=None, df_reviews=None, read_missing=True):
+    """
+    Write raw_restaurants / raw_reviews into SQLite.
+    DataFrames passed in (e.g. from fetch_data) are used directly;
+    otherwise each table is loaded from its raw Parquet/CSV file, unless
+    read_missing=False, in which case only the frames passed in are written.
+    Empty frames are skipped so an empty fetch never crashes to_sql.
+    """
     os.makedirs(DATA_DIR, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
 
     # raw_restaurants
-    df_rest = prepare_raw_restaurants()
-    if df_rest is not None:
-        df_rest.to_sql("raw_restaurants", conn, if_exists="replace", index=False)
-        print(f"Saved raw_restaurants → {DB_PATH} (rows={len(df_rest)})")
+    if df_places is not None or read_missing:
+        df_rest = prepare_raw_restaurants(df_places)
+        if df_rest is not None and df_rest.empty:
+            print("No restaurants to save, skipping raw_restaurants table.")
+        elif df_rest is not None:
+            df_rest.to_sql("raw_restaurants", conn, if_exists="replace", index=False)
+            print(f"Saved raw_restaurants → {DB_PATH} (rows={len(df_rest)})")
 
     # raw_reviews
-    df_reviews = prepare_raw_reviews()
-    if df_reviews is not None:
-        df_reviews.to_sql("raw_reviews", conn, if_exists="replace", index=False)
-        print(f"Saved raw_reviews → {DB_PATH} (rows={len(df_reviews)})")
+    if df_reviews is not None or read_missing:
+        df_reviews = prepare_raw_reviews(df_reviews)
+        if df_reviews is not None and df_reviews.empty:
+            print("No reviews to save, skipping raw_reviews table.")
+        elif df_reviews is not None:
+            df_reviews.to_sql("raw_reviews", conn, if_exists="replace", index=False)
+            print(f"Saved raw_reviews → {DB_PATH} (rows={len(df_reviews)})")
 
     conn.close()
 